@@ -0,0 +1,91 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.compile_to_pdp import c_to_llvm_ir, emit_pdp_assembly, llvm_ir_to_python_rep
+
+# Usage: python3 benchmarks/memory_benchmark.py --sizes 100 1000 5000
+#
+# Generates C files with an increasing number of functions, compiles each one in a
+# fresh process and reports the peak RSS of that process and the peak Python heap
+# used while lowering and emitting. Every function, main included, has a fixed size
+# and inlining is turned off, so only one function is buffered at a time. The RSS
+# includes the parsed LLVM module, which grows with the input; with streaming
+# emission the Python peak should stay flat.
+
+DEFAULT_SIZES = [100, 500, 1000, 2000, 5000]
+
+
+# Writes a C file with num_functions small functions, each calling the next one, and
+# a main that only calls the first
+def generate_c_file(c_file_path: str, num_functions: int):
+    with open(c_file_path, "w") as c_file:
+        c_file.write(f"int f{num_functions}(int a, int b) {{\n\treturn a + b;\n}}\n\n")
+
+        for i in reversed(range(num_functions)):
+            c_file.write(
+                f"int f{i}(int a, int b) {{\n"
+                f"\tint c = a + b;\n"
+                f"\tif (c > {i}) {{\n"
+                f"\t\tc = c * 3;\n"
+                f"\t}}\n"
+                f"\treturn f{i + 1}(c, {i});\n"
+                f"}}\n\n"
+            )
+
+        c_file.write("int main() {\n\tint x = 1;\n\tx = f0(x, 2);\n\treturn x;\n}\n")
+
+
+# Compiles a single file in this process and prints "<rss_kb> <python_peak_kb> <seconds>".
+# The Python peak only covers lowering and emission, not parsing the LLVM IR.
+def measure(c_file_path: str):
+    module = llvm_ir_to_python_rep(c_to_llvm_ir(c_file_path))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    emit_pdp_assembly(module, c_file_path.replace(".c", ".s"), inline_threshold=None)
+    elapsed = time.perf_counter() - start
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is in kilobytes on Linux
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(rss_peak, python_peak // 1024, f"{elapsed:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = "Measure peak memory of the compiler as the input grows")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Numbers of functions to generate")
+    parser.add_argument("--measure", metavar="C_FILE",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    print(f"{'functions':>10} {'peak RSS (KB)':>14} {'peak heap (KB)':>15} {'time (s)':>9}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            c_file_path = os.path.join(temp_dir, f"bench_{size}.c")
+            generate_c_file(c_file_path, size)
+
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", c_file_path],
+                capture_output=True, text=True, check=True)
+            rss_peak, python_peak, elapsed = result.stdout.split()
+
+            print(f"{size:>10} {rss_peak:>14} {python_peak:>15} {elapsed:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,43 @@
 import argparse
 
 from compiler.compile_to_pdp import compile_to_pdp_assembly
+from compiler.cost_model import COST_MODELS, format_summary
+from compiler.inlining import INLINE_BUDGET, INLINE_THRESHOLD
 
 # Usage: python3 compiler.py example_c_files/fib.c
+#        python3 compiler.py --summary --cpu 11/70 example_c_files/*.c
 def main():
 
     parser = argparse.ArgumentParser(
         description = "Compile C program into PDP program")
-    parser.add_argument("file_path",
-                        help="Name of the C file")
+    parser.add_argument("file_paths", nargs="+",
+                        help="Names of the C files")
+    parser.add_argument("--cpu", choices=COST_MODELS, default="11/40",
+                        help="PDP-11 model that instructions are selected and estimated for")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print estimated size and cycles of each function")
+    parser.add_argument("--listing", action="store_true",
+                        help="Annotate each line of the .s file with its address, size and cycles")
+    parser.add_argument("--inline-threshold", type=int, default=INLINE_THRESHOLD,
+                        help="Inline functions with at most this many IR instructions. "
+                             "Of the inline hints only __attribute__((always_inline)) is "
+                             "honoured, it lifts the threshold but not the budget")
+    parser.add_argument("--inline-budget", type=int, default=INLINE_BUDGET,
+                        help="Number of IR instructions inlining may add")
+    parser.add_argument("--no-inline", action="store_true",
+                        help="Keep every call")
     args = parser.parse_args()
-    file_path = args.file_path
+    cost_model = COST_MODELS[args.cpu]
+    inline_threshold = None if args.no_inline else args.inline_threshold
 
-    compile_to_pdp_assembly(file_path)
+    for file_path in args.file_paths:
+        estimates = compile_to_pdp_assembly(
+            file_path, cost_model, args.summary, args.listing, inline_threshold,
+            args.inline_budget)
+
+        if args.summary:
+            print(format_summary(file_path, cost_model, estimates))
     return
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,22 +3,67 @@ from llvmlite import binding
 import subprocess
 
 from . import python_rep_to_pdp_assembly
+from .cost_model import PDP_11_40, CostModel, FunctionEstimate, estimate_function, format_listing
+from .inlining import INLINE_BUDGET, INLINE_THRESHOLD
 
+# Size of the write buffer used when emitting the .s file
+OUTPUT_BUFFER_SIZE = 1 << 16
 
-# Compiles a C program located at file_path and create a PDP assembly file from it
-def compile_to_pdp_assembly(c_file_path: str):
+
+# Compiles a C program located at file_path and create a PDP assembly file from it.
+# Instructions are selected for cost_model. With estimate, returns a size and cycle
+# estimate for every function, and with listing the .s file is annotated with each
+# line's address, size and cycles.
+# Functions up to inline_threshold IR instructions are inlined, None turns it off.
+def compile_to_pdp_assembly(
+    c_file_path: str,
+    cost_model: CostModel = PDP_11_40,
+    estimate: bool = False,
+    listing: bool = False,
+    inline_threshold: int = INLINE_THRESHOLD,
+    inline_budget: int = INLINE_BUDGET,
+) -> list[FunctionEstimate]:
     llvm_path_name = c_to_llvm_ir(c_file_path)
     
     module = llvm_ir_to_python_rep(llvm_path_name)
-    pdp_assembly = python_rep_to_pdp_assembly.python_rep_to_pdp_assembly(module)
 
     pdp_file_path = c_file_path.replace(".c", ".s")
+    return emit_pdp_assembly(
+        module, pdp_file_path, cost_model, estimate, listing, inline_threshold, inline_budget
+    )
 
-    with open(pdp_file_path, "w") as pdp_file:
-        for value in pdp_assembly:
-            pdp_file.write(str(value) + "\n")
-    
-    return pdp_assembly
+
+# Lowers module and writes each function to pdp_file_path as soon as it is lowered,
+# so the whole program is never held in memory. This is the only place instructions
+# are formatted as text.
+def emit_pdp_assembly(
+    module: llvmlite.binding.module.ModuleRef,
+    pdp_file_path: str,
+    cost_model: CostModel = PDP_11_40,
+    estimate: bool = False,
+    listing: bool = False,
+    inline_threshold: int = INLINE_THRESHOLD,
+    inline_budget: int = INLINE_BUDGET,
+) -> list[FunctionEstimate]:
+    pdp_assembly = python_rep_to_pdp_assembly.python_rep_to_pdp_assembly(
+        module, cost_model, inline_threshold, inline_budget
+    )
+
+    estimates = []
+    address = 0
+    with open(pdp_file_path, "w", buffering=OUTPUT_BUFFER_SIZE) as pdp_file:
+        for stream in pdp_assembly:
+            if not estimate and not listing:
+                lines = stream.format_lines()
+            else:
+                costs, function_estimate = estimate_function(stream, cost_model, address)
+                estimates.append(function_estimate)
+                address += 2 * function_estimate.size
+                lines = format_listing(stream, costs) if listing else stream.format_lines()
+
+            pdp_file.writelines(f"{line}\n" for line in lines)
+
+    return estimates
 
 
 # Creates an LLVM IR file at the same location as c_file_path
@@ -0,0 +1,234 @@
+from collections.abc import Iterator
+from typing import NamedTuple
+
+from .instructions import (
+    NO_OPERAND,
+    AddressingMode,
+    Instruction,
+    InstructionStream,
+    Opcode,
+    Registers,
+    operand_mode,
+    operand_register,
+    operand_value,
+)
+
+# Static size and timing estimates for lowered PDP code. Times come from a per-CPU
+# table of base execution times and operand address times in nanoseconds, which
+# are converted to cycles of the model's microcycle.
+
+BRANCH_OPCODES = {Opcode.BR, Opcode.BEQ, Opcode.BNE, Opcode.BLE,
+                  Opcode.BGT, Opcode.BGE, Opcode.BLT}
+# Instructions after which control never falls through
+TERMINATOR_OPCODES = {Opcode.BR, Opcode.RTS, Opcode.RET, Opcode.HALT}
+
+
+# Timing model for a PDP-11 variant
+class CostModel:
+    def __init__(
+        self,
+        name: str,
+        cycle_ns: int,
+        base_ns: dict[Opcode, int],
+        source_ns: list[int],
+        destination_ns: list[int],
+    ):
+        self.name = name
+        self.cycle_ns = cycle_ns
+        # execution time of each opcode with register operands
+        self.base_ns = base_ns
+        # extra time to fetch an operand, indexed by addressing mode
+        self.source_ns = source_ns
+        self.destination_ns = destination_ns
+
+    def instruction_ns(self, instruction: Instruction) -> int:
+        if instruction.opcode == Opcode.LABEL:
+            return 0
+
+        time = self.base_ns[instruction.opcode]
+        # branch and JSR targets are encoded in the instruction, not fetched
+        if instruction.opcode in BRANCH_OPCODES or instruction.opcode == Opcode.JSR:
+            return time
+
+        operands = [op for op in (instruction.operand1, instruction.operand2) if op != NO_OPERAND]
+        if len(operands) == 2:
+            time += self.source_ns[operand_mode(operands[0])]
+        if operands:
+            time += self.destination_ns[operand_mode(operands[-1])]
+
+        return time
+
+    def cycles(self, instruction: Instruction) -> int:
+        return -(-self.instruction_ns(instruction) // self.cycle_ns)
+
+
+# Approximate timings from the PDP-11 processor handbooks
+PDP_11_40 = CostModel(
+    name="11/40",
+    cycle_ns=140,
+    base_ns={
+        Opcode.MOV: 900, Opcode.ADD: 990, Opcode.SUB: 990, Opcode.CMP: 990,
+        Opcode.TST: 990, Opcode.MUL: 8880, Opcode.DIV: 11300,
+        Opcode.INC: 990, Opcode.DEC: 990, Opcode.NEG: 990, Opcode.CLR: 990,
+        Opcode.BIS: 990,
+        Opcode.BR: 760, Opcode.BEQ: 760, Opcode.BNE: 760, Opcode.BLE: 760,
+        Opcode.BGT: 760, Opcode.BGE: 760, Opcode.BLT: 760,
+        Opcode.JSR: 3500, Opcode.RTS: 2420, Opcode.RET: 2420, Opcode.HALT: 1800,
+    },
+    source_ns=[0, 780, 840, 1740, 840, 1740, 1460, 2360],
+    destination_ns=[0, 1440, 1500, 2400, 1500, 2400, 2160, 3060],
+)
+
+PDP_11_70 = CostModel(
+    name="11/70",
+    cycle_ns=150,
+    base_ns={
+        Opcode.MOV: 300, Opcode.ADD: 300, Opcode.SUB: 300, Opcode.CMP: 300,
+        Opcode.TST: 300, Opcode.MUL: 3300, Opcode.DIV: 7050,
+        Opcode.INC: 300, Opcode.DEC: 300, Opcode.NEG: 300, Opcode.CLR: 300,
+        Opcode.BIS: 300,
+        Opcode.BR: 450, Opcode.BEQ: 450, Opcode.BNE: 450, Opcode.BLE: 450,
+        Opcode.BGT: 450, Opcode.BGE: 450, Opcode.BLT: 450,
+        Opcode.JSR: 1050, Opcode.RTS: 1050, Opcode.RET: 1050, Opcode.HALT: 1800,
+    },
+    source_ns=[0, 300, 300, 600, 450, 750, 600, 900],
+    destination_ns=[0, 600, 600, 900, 750, 1050, 900, 1200],
+)
+
+COST_MODELS = {model.name: model for model in (PDP_11_40, PDP_11_70)}
+
+
+# Size in words of an instruction: one for the opcode and one more for every operand
+# that carries an index, immediate or address after it
+def instruction_size(instruction: Instruction) -> int:
+    if instruction.opcode == Opcode.LABEL:
+        return 0
+    # branch offsets are part of the opcode word
+    if instruction.opcode in BRANCH_OPCODES:
+        return 1
+
+    size = 1
+    for operand in (instruction.operand1, instruction.operand2):
+        if operand == NO_OPERAND:
+            continue
+        mode = operand_mode(operand)
+        if mode in (AddressingMode.INDEX, AddressingMode.INDEX_DEFERRED):
+            size += 1
+        elif operand_register(operand) == Registers.PC and mode in (
+            AddressingMode.AUTOINCREMENT, AddressingMode.AUTOINCREMENT_DEFERRED
+        ):
+            size += 1
+    return size
+
+
+class InstructionCost(NamedTuple):
+    # byte address of the instruction
+    address: int
+    # size in words
+    size: int
+    cycles: int
+
+
+# Totals for a basic block, a loop or a function
+class CostSummary(NamedTuple):
+    name: str
+    size: int
+    cycles: int
+
+
+class FunctionEstimate(NamedTuple):
+    name: str
+    size: int
+    cycles: int
+    blocks: list[CostSummary]
+    # cycles of a single trip round each loop, named after the loop header
+    loops: list[CostSummary]
+    # number of call sites (JSR instructions)
+    calls: int
+
+
+def _summarize(name: str, costs: list[InstructionCost]) -> CostSummary:
+    return CostSummary(name,
+                       sum(cost.size for cost in costs),
+                       sum(cost.cycles for cost in costs))
+
+
+# Assigns an address, size and cycle count to every line of a function's stream
+# and rolls them up per basic block, per loop and for the whole function
+def estimate_function(
+    stream: InstructionStream, model: CostModel, start_address: int = 0
+) -> tuple[list[InstructionCost], FunctionEstimate]:
+    costs = []
+    address = start_address
+    for instruction in stream:
+        size = instruction_size(instruction)
+        costs.append(InstructionCost(address, size, model.cycles(instruction)))
+        address += 2 * size
+
+    # basic blocks start at labels and after instructions that transfer control
+    # unlabelled blocks are named by their distance from the last label
+    blocks = []
+    label_positions = {}
+    label_name = ""
+    label_start = 0
+    block_name = ""
+    block_start = 0
+    for index, instruction in enumerate(stream):
+        if instruction.opcode == Opcode.LABEL:
+            label_id = operand_value(instruction.operand1)
+            label_positions[label_id] = index
+            if index > block_start:
+                blocks.append(_summarize(block_name, costs[block_start:index]))
+            label_name = block_name = stream.labels.name(label_id)
+            label_start = block_start = index
+        elif instruction.opcode in TERMINATOR_OPCODES or instruction.opcode in BRANCH_OPCODES:
+            blocks.append(_summarize(block_name, costs[block_start:index + 1]))
+            block_name = f"{label_name}+{index + 1 - label_start}"
+            block_start = index + 1
+    if block_start < len(stream):
+        blocks.append(_summarize(block_name, costs[block_start:]))
+
+    # a branch back to an earlier label closes a loop, the widest one per header wins
+    loop_ends = {}
+    for index, instruction in enumerate(stream):
+        if instruction.opcode in BRANCH_OPCODES:
+            label_id = operand_value(instruction.operand1)
+            if label_positions.get(label_id, index + 1) <= index:
+                loop_ends[label_id] = max(loop_ends.get(label_id, index), index)
+    loops = [
+        _summarize(stream.labels.name(label_id), costs[label_positions[label_id]:end + 1])
+        for label_id, end in sorted(loop_ends.items(), key=lambda item: label_positions[item[0]])
+    ]
+
+    function_name = blocks[0].name if blocks else ""
+    function_summary = _summarize(function_name, costs)
+    calls = sum(1 for opcode in stream.opcodes if opcode == Opcode.JSR)
+    estimate = FunctionEstimate(function_name, function_summary.size,
+                                function_summary.cycles, blocks, loops, calls)
+    return costs, estimate
+
+
+# Lines of the function with their address, size and cycles appended as a comment
+def format_listing(stream: InstructionStream, costs: list[InstructionCost]) -> Iterator[str]:
+    for index, cost in enumerate(costs):
+        line = stream.format_line(index).expandtabs()
+        if stream.opcodes[index] == Opcode.LABEL:
+            yield f"{line:<31} ; {oct(cost.address)[2:]:>6}"
+        else:
+            yield f"{line:<31} ; {oct(cost.address)[2:]:>6} {cost.size:>2}w {cost.cycles:>4}c"
+
+
+# Table of per-function totals for a compiled file
+def format_summary(file_path: str, model: CostModel, estimates: list[FunctionEstimate]) -> str:
+    lines = [f"{file_path} (PDP-{model.name})",
+             f"  {'function':<20} {'words':>6} {'cycles':>8} {'blocks':>7} {'loops':>6} "
+             f"{'calls':>6}"]
+    for estimate in estimates:
+        lines.append(f"  {estimate.name:<20} {estimate.size:>6} {estimate.cycles:>8} "
+                     f"{len(estimate.blocks):>7} {len(estimate.loops):>6} {estimate.calls:>6}")
+        for loop in estimate.loops:
+            lines.append(f"    loop {loop.name:<15} {loop.size:>6} {loop.cycles:>8}")
+    lines.append(f"  {'total':<20} {sum(e.size for e in estimates):>6} "
+                 f"{sum(e.cycles for e in estimates):>8} {'':>7} {'':>6} "
+                 f"{sum(e.calls for e in estimates):>6}")
+    return "\n".join(lines)
@@ -0,0 +1,145 @@
+import heapq
+
+from llvmlite import binding
+
+# Chooses which functions are inlined at their call sites while lowering. Clang
+# marks every function noinline at -O0, so LLVM's own inliner would not touch them.
+
+# Largest callee, in IR instructions, that is inlined without an inline hint
+INLINE_THRESHOLD = 24
+# Number of IR instructions inlining may add to the module
+INLINE_BUDGET = 64
+# At -O0 clang drops the inline keyword without a trace, only always_inline is kept
+INLINE_HINTS = {b"alwaysinline"}
+
+
+# Number of instructions that are lowered to code, allocas only reserve stack
+def function_size(function: binding.ValueRef) -> int:
+    return sum(
+        1
+        for block in function.blocks
+        for instr in block.instructions
+        if instr.opcode != "alloca"
+    )
+
+
+# Names of the functions called by function, once per call site
+def called_functions(function: binding.ValueRef) -> list[str]:
+    callees = []
+    for block in function.blocks:
+        for instr in block.instructions:
+            if instr.opcode == "call":
+                callees.append(list(instr.operands)[-1].name)
+    return callees
+
+
+# Functions that can reach themselves through calls, found with one pass of Tarjan's
+# strongly connected components algorithm. A function is recursive when its component
+# has other members or it calls itself. The search keeps its own stack so that long
+# call chains do not hit Python's recursion limit.
+def recursive_functions(call_graph: dict[str, list[str]]) -> set[str]:
+    recursive = set()
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    # functions whose callees are being searched, with the callees left to look at
+    work = []
+
+    def visit(name: str):
+        index[name] = lowlink[name] = len(index)
+        stack.append(name)
+        on_stack.add(name)
+        work.append((name, iter(call_graph[name])))
+
+    for root in call_graph:
+        if root in index:
+            continue
+        visit(root)
+        while work:
+            name, callees = work[-1]
+            for callee in callees:
+                if callee not in call_graph:
+                    continue
+                if callee not in index:
+                    visit(callee)
+                    break
+                if callee in on_stack:
+                    lowlink[name] = min(lowlink[name], index[callee])
+            else:
+                work.pop()
+                if work:
+                    caller = work[-1][0]
+                    lowlink[caller] = min(lowlink[caller], lowlink[name])
+                if lowlink[name] == index[name]:
+                    component = []
+                    while not component or component[-1] != name:
+                        component.append(stack.pop())
+                        on_stack.discard(component[-1])
+                    if len(component) > 1 or name in call_graph[name]:
+                        recursive.update(component)
+    return recursive
+
+
+# Picks the functions to inline everywhere they are called. A callee qualifies when it
+# is under the threshold or marked always_inline and is not part of a recursive cycle.
+# Functions are visited callees first, smallest first, and the size of a function
+# includes the bodies already inlined into it. Its out-of-line copy is no longer
+# emitted, so inlining it costs one copy of that size for every call site after the
+# first; when a caller is inlined in turn, the copies nested in it are charged again
+# with it. The growth has to fit in what is left of the budget.
+def plan_inlining(
+    module: binding.ModuleRef,
+    threshold: int = INLINE_THRESHOLD,
+    budget: int = INLINE_BUDGET,
+    main_name: str = "main",
+) -> dict[str, binding.ValueRef]:
+    functions = {
+        function.name: function for function in module.functions if not function.is_declaration
+    }
+    call_graph = {
+        name: [callee for callee in called_functions(function) if callee in functions]
+        for name, function in functions.items()
+    }
+    recursive = recursive_functions(call_graph)
+
+    # callers once per call site
+    callers = {name: [] for name in functions}
+    for name, callees in call_graph.items():
+        for callee in callees:
+            callers[callee].append(name)
+
+    # a function is visited once all its callees outside recursive cycles have been
+    pending = {
+        name: sum(1 for callee in callees if callee not in recursive)
+        for name, callees in call_graph.items()
+    }
+    sizes = {name: function_size(function) for name, function in functions.items()}
+    ready = [(sizes[name], name) for name in functions if not pending[name]]
+    heapq.heapify(ready)
+
+    inlined = {}
+    while ready:
+        _, name = heapq.heappop(ready)
+        function = functions[name]
+        call_sites = len(callers[name])
+
+        if name != main_name and name not in recursive and call_sites:
+            # attributes come back as space separated groups
+            attributes = b" ".join(function.attributes).split()
+            hinted = any(attribute in INLINE_HINTS for attribute in attributes)
+
+            growth = sizes[name] * (call_sites - 1)
+            if (sizes[name] <= threshold or hinted) and growth <= budget:
+                budget -= growth
+                inlined[name] = function
+
+        for caller in callers[name]:
+            if name in inlined:
+                sizes[caller] += sizes[name]
+            if name not in recursive:
+                pending[caller] -= 1
+                if not pending[caller]:
+                    heapq.heappush(ready, (sizes[caller], caller))
+
+    return inlined
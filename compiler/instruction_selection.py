@@ -0,0 +1,140 @@
+from collections.abc import Callable
+from typing import NamedTuple
+
+from .cost_model import CostModel, instruction_size
+from .instructions import (
+    NO_OPERAND,
+    Instruction,
+    Opcode,
+    Registers,
+    is_immediate,
+    operand_value,
+    register_operand,
+)
+
+# Table-driven instruction selection. Each IR operation has a list of patterns over
+# its operands a and b and the result slot dst, which are already encoded PDP
+# operands (immediates, stack slots or registers). The cheapest pattern that applies
+# under the cost model is emitted. Supporting a new operation or a cheaper special
+# case is a new table entry.
+
+R0 = register_operand(Registers.R0)
+R1 = register_operand(Registers.R1)
+
+# Operations where a and b can be swapped
+COMMUTATIVE = {"add", "mul", "or"}
+
+
+class Pattern(NamedTuple):
+    # whether the pattern computes the right result for (a, b, dst)
+    applies: Callable[[int, int, int], bool]
+    # instructions with "a", "b" and "dst" standing for the operands
+    template: tuple[tuple, ...]
+
+
+def _always(a: int, b: int, dst: int) -> bool:
+    return True
+
+
+def _a_is(value: int) -> Callable[[int, int, int], bool]:
+    return lambda a, b, dst: is_immediate(a) and operand_value(a) == value
+
+
+def _b_is(value: int) -> Callable[[int, int, int], bool]:
+    return lambda a, b, dst: is_immediate(b) and operand_value(b) == value
+
+
+# Two instruction forms write dst before reading b
+def _b_not_dst(a: int, b: int, dst: int) -> bool:
+    return b != dst
+
+
+def _only_b_is_dst(a: int, b: int, dst: int) -> bool:
+    return b == dst and a != dst
+
+
+PATTERNS = {
+    # copies, used for stores, loads, return values and call arguments
+    "move": [
+        Pattern(_a_is(0), ((Opcode.CLR, "dst"),)),
+        Pattern(_always, ((Opcode.MOV, "a", "dst"),)),
+    ],
+    "add": [
+        Pattern(_b_is(0), ((Opcode.MOV, "a", "dst"),)),
+        Pattern(_b_is(1), ((Opcode.MOV, "a", "dst"), (Opcode.INC, "dst"))),
+        Pattern(_b_is(-1), ((Opcode.MOV, "a", "dst"), (Opcode.DEC, "dst"))),
+        Pattern(_b_not_dst, ((Opcode.MOV, "a", "dst"), (Opcode.ADD, "b", "dst"))),
+    ],
+    "sub": [
+        Pattern(_b_is(0), ((Opcode.MOV, "a", "dst"),)),
+        Pattern(_b_is(1), ((Opcode.MOV, "a", "dst"), (Opcode.DEC, "dst"))),
+        Pattern(_b_is(-1), ((Opcode.MOV, "a", "dst"), (Opcode.INC, "dst"))),
+        Pattern(_a_is(0), ((Opcode.MOV, "b", "dst"), (Opcode.NEG, "dst"))),
+        Pattern(_b_not_dst, ((Opcode.MOV, "a", "dst"), (Opcode.SUB, "b", "dst"))),
+        Pattern(_only_b_is_dst, ((Opcode.NEG, "dst"), (Opcode.ADD, "a", "dst"))),
+    ],
+    # MUL leaves the low word of the product in R1
+    "mul": [
+        Pattern(_b_is(0), ((Opcode.CLR, "dst"),)),
+        Pattern(_b_is(1), ((Opcode.MOV, "a", "dst"),)),
+        Pattern(_always, ((Opcode.MOV, "a", R0), (Opcode.MUL, "b", R0), (Opcode.MOV, R1, "dst"))),
+    ],
+    # DIV divides R0:R1, leaving the quotient in R0 and the remainder in R1
+    "sdiv": [
+        Pattern(_b_is(1), ((Opcode.MOV, "a", "dst"),)),
+        Pattern(_always, ((Opcode.CLR, R0), (Opcode.MOV, "a", R1),
+                          (Opcode.DIV, "b", R0), (Opcode.MOV, R0, "dst"))),
+    ],
+    "srem": [
+        Pattern(_b_is(1), ((Opcode.CLR, "dst"),)),
+        Pattern(_always, ((Opcode.CLR, R0), (Opcode.MOV, "a", R1),
+                          (Opcode.DIV, "b", R0), (Opcode.MOV, R1, "dst"))),
+    ],
+    "or": [
+        Pattern(_b_is(0), ((Opcode.MOV, "a", "dst"),)),
+        Pattern(_b_not_dst, ((Opcode.MOV, "a", "dst"), (Opcode.BIS, "b", "dst"))),
+    ],
+}
+
+# IR operations lowered through the pattern table
+BINARY_OPERATIONS = PATTERNS.keys() - {"move"}
+
+
+def _instantiate(template: tuple[tuple, ...], a: int, b: int, dst: int) -> list[Instruction]:
+    operands = {"a": a, "b": b, "dst": dst}
+    instructions = []
+    for opcode, *specs in template:
+        instruction = Instruction(opcode, *(operands.get(spec, spec) for spec in specs))
+        # copying a slot onto itself does nothing
+        if opcode == Opcode.MOV and instruction.operand1 == instruction.operand2:
+            continue
+        instructions.append(instruction)
+    return instructions
+
+
+# Compared in nanoseconds, rounding each instruction up to whole cycles would rank
+# sequences that take the same time differently
+def _cost(instructions: list[Instruction], model: CostModel) -> tuple[int, int]:
+    return (sum(model.instruction_ns(instruction) for instruction in instructions),
+            sum(instruction_size(instruction) for instruction in instructions))
+
+
+# Cheapest instructions computing operation(a, b) into dst, or None if no pattern applies
+def select(
+    operation: str, a: int, b: int, dst: int, model: CostModel
+) -> list[Instruction] | None:
+    orders = [(a, b), (b, a)] if operation in COMMUTATIVE else [(a, b)]
+
+    best = None
+    for first, second in orders:
+        for pattern in PATTERNS[operation]:
+            if not pattern.applies(first, second, dst):
+                continue
+            instructions = _instantiate(pattern.template, first, second, dst)
+            if best is None or _cost(instructions, model) < _cost(best, model):
+                best = instructions
+    return best
+
+
+def select_move(source: int, dst: int, model: CostModel) -> list[Instruction]:
+    return select("move", source, NO_OPERAND, dst, model)
@@ -0,0 +1,253 @@
+from array import array
+from collections.abc import Iterator
+from enum import IntEnum
+from typing import NamedTuple
+
+# Compact representation of PDP assembly. Instructions are stored in parallel arrays
+# with integer-encoded opcodes and operands, and only turned into text on emission.
+
+
+# PDP opcodes
+class Opcode(IntEnum):
+    # Pseudo-op marking a label definition, its first operand is the label
+    LABEL = 0
+    MOV = 1
+    ADD = 2
+    HALT = 3
+    RET = 4
+    RTS = 5
+    SUB = 6
+    JSR = 7
+    BR = 8
+    BEQ = 9
+    TST = 10
+    CMP = 11
+    BLE = 12
+    BGT = 13
+    BGE = 14
+    BLT = 15
+    BNE = 16
+    DIV = 17
+    MUL = 18
+    INC = 19
+    DEC = 20
+    NEG = 21
+    CLR = 22
+    BIS = 23
+
+
+# PDP registers, numbered as in the hardware
+class Registers(IntEnum):
+    R0 = 0
+    R1 = 1
+    R2 = 2
+    R3 = 3
+    R4 = 4
+    R5 = 5
+    SP = 6
+    PC = 7
+
+
+# PDP addressing modes, numbered as in the hardware
+class AddressingMode(IntEnum):
+    REGISTER = 0
+    REGISTER_DEFERRED = 1
+    AUTOINCREMENT = 2
+    AUTOINCREMENT_DEFERRED = 3
+    AUTODECREMENT = 4
+    AUTODECREMENT_DEFERRED = 5
+    INDEX = 6
+    INDEX_DEFERRED = 7
+
+
+# -----------------------------------------------------------------------
+# Operand encoding
+# -----------------------------------------------------------------------
+
+# An operand is a single int laid out as  value << 7 | 1 << 6 | mode << 3 | register.
+# Bit 6 marks the operand as present so that 0 can stand for "no operand". The value
+# is an offset, an immediate or a label id depending on the mode and register.
+NO_OPERAND = 0
+_PRESENT = 1 << 6
+
+
+def encode_operand(mode: AddressingMode, register: Registers, value: int = 0) -> int:
+    return (value << 7) | _PRESENT | (mode << 3) | register
+
+
+def register_operand(register: Registers) -> int:
+    return encode_operand(AddressingMode.REGISTER, register)
+
+
+def indexed_operand(register: Registers, offset: int) -> int:
+    return encode_operand(AddressingMode.INDEX, register, offset)
+
+
+# Immediates are autoincrement through PC (#n)
+def immediate_operand(value: int) -> int:
+    return encode_operand(AddressingMode.AUTOINCREMENT, Registers.PC, value)
+
+
+# Labels are PC relative (name)
+def label_operand(label_id: int) -> int:
+    return encode_operand(AddressingMode.INDEX, Registers.PC, label_id)
+
+
+def operand_mode(operand: int) -> AddressingMode:
+    return AddressingMode((operand >> 3) & 7)
+
+
+def operand_register(operand: int) -> Registers:
+    return Registers(operand & 7)
+
+
+def operand_value(operand: int) -> int:
+    return operand >> 7
+
+
+def is_immediate(operand: int) -> bool:
+    return operand & 0x7F == immediate_operand(0)
+
+
+# -----------------------------------------------------------------------
+# Labels
+# -----------------------------------------------------------------------
+
+
+# Interns label names so that instructions only need to store an id
+class LabelTable:
+    def __init__(self):
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, name: str) -> int:
+        label_id = self.ids.get(name)
+        if label_id is None:
+            label_id = len(self.names)
+            self.ids[name] = label_id
+            self.names.append(name)
+        return label_id
+
+    def name(self, label_id: int) -> str:
+        return self.names[label_id]
+
+
+# -----------------------------------------------------------------------
+# Instruction stream
+# -----------------------------------------------------------------------
+
+
+# View of a single instruction in a stream
+class Instruction(NamedTuple):
+    opcode: Opcode
+    operand1: int = NO_OPERAND
+    operand2: int = NO_OPERAND
+
+
+# Struct-of-arrays list of instructions and label definitions
+class InstructionStream:
+    __slots__ = ("labels", "opcodes", "first_operands", "second_operands")
+
+    def __init__(self, labels: LabelTable):
+        self.labels = labels
+        self.opcodes = array("B")
+        self.first_operands = array("q")
+        self.second_operands = array("q")
+
+    def append(self, opcode: Opcode, operand1: int = NO_OPERAND, operand2: int = NO_OPERAND):
+        self.opcodes.append(opcode)
+        self.first_operands.append(operand1)
+        self.second_operands.append(operand2)
+
+    def extend(self, instructions: list[Instruction]):
+        for instruction in instructions:
+            self.append(*instruction)
+
+    def append_label(self, label_id: int):
+        self.append(Opcode.LABEL, label_operand(label_id))
+
+    def pop(self) -> Instruction:
+        return Instruction(Opcode(self.opcodes.pop()),
+                           self.first_operands.pop(),
+                           self.second_operands.pop())
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def __getitem__(self, index: int) -> Instruction:
+        return Instruction(Opcode(self.opcodes[index]),
+                           self.first_operands[index],
+                           self.second_operands[index])
+
+    def __iter__(self) -> Iterator[Instruction]:
+        for index in range(len(self.opcodes)):
+            yield self[index]
+
+    def format_line(self, index: int) -> str:
+        return format_instruction(self[index], self.labels)
+
+    def format_lines(self) -> Iterator[str]:
+        for index in range(len(self.opcodes)):
+            yield self.format_line(index)
+
+
+# -----------------------------------------------------------------------
+# Formatting
+# -----------------------------------------------------------------------
+
+
+def _octal(value: int) -> str:
+    if value < 0:
+        return "-" + oct(-value)[2:]
+    return oct(value)[2:]
+
+
+def format_operand(operand: int, labels: LabelTable) -> str:
+    mode = operand_mode(operand)
+    register = operand_register(operand)
+    value = operand_value(operand)
+    register_name = register.name
+
+    if register == Registers.PC:
+        match mode:
+            case AddressingMode.AUTOINCREMENT:
+                return f"#{_octal(value)}"
+            case AddressingMode.AUTOINCREMENT_DEFERRED:
+                return f"@#{_octal(value)}"
+            case AddressingMode.INDEX:
+                return labels.name(value)
+            case AddressingMode.INDEX_DEFERRED:
+                return f"@{labels.name(value)}"
+
+    match mode:
+        case AddressingMode.REGISTER:
+            return register_name
+        case AddressingMode.REGISTER_DEFERRED:
+            return f"({register_name})"
+        case AddressingMode.AUTOINCREMENT:
+            return f"({register_name})+"
+        case AddressingMode.AUTOINCREMENT_DEFERRED:
+            return f"@({register_name})+"
+        case AddressingMode.AUTODECREMENT:
+            return f"-({register_name})"
+        case AddressingMode.AUTODECREMENT_DEFERRED:
+            return f"@-({register_name})"
+        case AddressingMode.INDEX:
+            return f"{_octal(value)}({register_name})"
+        case AddressingMode.INDEX_DEFERRED:
+            return f"@{_octal(value)}({register_name})"
+
+
+def format_instruction(instruction: Instruction, labels: LabelTable) -> str:
+    if instruction.opcode == Opcode.LABEL:
+        return f"{labels.name(operand_value(instruction.operand1))}:"
+
+    opcode_name = instruction.opcode.name
+    if instruction.operand1 != NO_OPERAND and instruction.operand2 != NO_OPERAND:
+        operand1 = format_operand(instruction.operand1, labels)
+        operand2 = format_operand(instruction.operand2, labels)
+        return f"\t{opcode_name} {operand1}, {operand2}"
+    elif instruction.operand1 != NO_OPERAND:
+        return f"\t{opcode_name} {format_operand(instruction.operand1, labels)}"
+    else:
+        return f"\t{opcode_name}"
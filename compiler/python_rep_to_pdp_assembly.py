@@ -1,39 +1,28 @@
 import llvmlite
+from collections.abc import Iterator
 from enum import Enum
+from typing import NamedTuple
+
+from .cost_model import PDP_11_40, CostModel
+from .inlining import INLINE_BUDGET, INLINE_THRESHOLD, plan_inlining
+from .instruction_selection import BINARY_OPERATIONS, select, select_move
+from .instructions import (
+    Instruction,
+    InstructionStream,
+    LabelTable,
+    Opcode,
+    Registers,
+    immediate_operand,
+    indexed_operand,
+    is_immediate,
+    label_operand,
+    operand_value,
+    register_operand,
+)
 
 branch_counter = 0
 label_counter = 0
 
-# PDP opcodes
-class Opcode(Enum):
-    MOV = "MOV"
-    ADD = "ADD"
-    HALT = "HALT"
-    RET = "RET"
-    RTS = "RTS"
-    SUB = "SUB"
-    JSR = "JSR"
-    BR = "BR"
-    BEQ = "BEQ"
-    TST = "TST"
-    CMP = "CMP"
-    BLE = "BLE"
-    BGT = "BGT"
-    BGE = "BGE"
-    BLT = "BLT"
-    BNE = "BNE"
-    DIV = "DIV"
-    MUL = "MUL"
-
-
-# PDP registers
-class Registers(Enum):
-    R0 = "R0"
-    R1 = "R1"
-    R2 = "R2"
-    PC = "PC"
-    SP = "SP"
-
 
 # Useful labels for compilers
 class Labels(Enum):
@@ -54,8 +43,12 @@ class ICMP_Type(Enum):
 
 
 # Useful constants
-TOP_OF_STACK = "#40000"
-ZERO = "#0"
+TOP_OF_STACK = immediate_operand(0o40000)
+ZERO = immediate_operand(0)
+ONE = immediate_operand(1)
+R0 = register_operand(Registers.R0)
+SP = register_operand(Registers.SP)
+PC = register_operand(Registers.PC)
 ICMP_TYPE_DICT = {ICMP_Type.SGE.value: Opcode.BGE, 
                   ICMP_Type.SGT.value: Opcode.BGT, 
                   ICMP_Type.SLE.value: Opcode.BLE, 
@@ -64,65 +57,85 @@ ICMP_TYPE_DICT = {ICMP_Type.SGE.value: Opcode.BGE,
                   ICMP_Type.NE.value: Opcode.BNE, }
 
 
+# An IR instruction parsed from the text of its function, so that lowering does not
+# have to print every instruction and operand again. Operands are the values read,
+# "%n" for a local value and the literal itself for a constant.
+class IRInstruction(NamedTuple):
+    opcode: str
+    # value defined by the instruction, None if it has no result
+    identifier: str
+    operands: list[str]
+    # branch targets
+    labels: tuple[str, ...] = ()
+    # icmp predicate or called function
+    predicate: str = None
+    callee: str = None
+
+
+class IRBlock(NamedTuple):
+    # None for an unlabelled entry block
+    label: str
+    instructions: list[IRInstruction]
+
+
+class IRFunction(NamedTuple):
+    name: str
+    params: list[str]
+    blocks: list[IRBlock]
+
+
 # Dictionary from identifier to location on the stack
 class Environment:
-    def __init__(self):
+    def __init__(
+        self,
+        cost_model: CostModel,
+        inlined_functions: dict[str, IRFunction] = None,
+    ):
         self.stack_env: dict[str, int] = {}
-        self.labels_env: dict[str, str] = {}
+        self.labels_env: dict[str, int] = {}
         self.next_offset = 2
-
-    def get(self, identifier: str) -> str:
-        return oct(self.stack_env[identifier])[2:] + "(SP)"
+        self.cost_model = cost_model
+        # functions whose body replaces every call to them
+        self.inlined_functions = inlined_functions or {}
+        # where ret leaves its value when this function is inlined into a caller
+        self.return_slot: int = None
+        self.return_label: int = None
+        self.return_branches = 0
+        # number of times each value is used in the function
+        self.use_counts: dict[str, int] = {}
+        # loads whose only use reads the loaded slot directly
+        self.folded_loads: set[str] = set()
+        # compares evaluated by the branch that uses them
+        self.fused_compares: dict[str, IRInstruction] = {}
+        # values written straight into the slot of the store that follows them
+        self.result_slots: dict[str, str] = {}
+
+    def get(self, identifier: str) -> int:
+        return indexed_operand(Registers.SP, self.stack_env[identifier])
 
     def add(self, identifier: str, size: int):
         self.stack_env[identifier] = self.next_offset
         self.next_offset += size
 
+    # Makes identifier refer to the same location as other
+    def alias(self, identifier: str, other: str):
+        self.stack_env[identifier] = self.stack_env[other]
+
+    # Places identifier at an offset that is already in use, such as a caller's slot
+    def bind(self, identifier: str, offset: int):
+        self.stack_env[identifier] = offset
+
     def remove(self, identifier: str) -> int:
         return self.stack_env.pop(identifier)
 
-    def add_label(self, identifier: str, label_name: str):
-        self.labels_env[identifier] = label_name
+    def add_label(self, identifier: str, label_id: int):
+        self.labels_env[identifier] = label_id
 
-    def get_label(self, identifier: str) -> str:
+    def get_label(self, identifier: str) -> int:
         return self.labels_env[identifier]
     
     def has_label(self, identifier: str) -> bool:
         return identifier in self.labels_env
-            
-
-
-
-# Base class for a single line of assembly code
-class LineOfAssembly:
-    # Should not be called
-    def __init__():
-        return
-
-
-# Assembly labels
-class Label(LineOfAssembly):
-    def __init__(self, label_name):
-        self.label_name = label_name
-
-    def __str__(self):
-        return f"{self.opcode.value}:"
-
-
-# Assembly instructions
-class Instruction(LineOfAssembly):
-    def __init__(self, opcode: Opcode, operand1: str = None, operand2: str = None):
-        self.opcode = opcode
-        self.operand1 = operand1
-        self.operand2 = operand2
-
-    def __str__(self):
-        if self.operand1 is not None and self.operand2 is not None:
-            return f"\t{self.opcode.value} {self.operand1}, {self.operand2}"
-        elif self.operand1 is not None:
-            return f"\t{self.opcode.value} {self.operand1}"
-        else:
-            return f"\t{self.opcode.value}"
 
 
 # -----------------------------------------------------------------------
@@ -130,446 +143,388 @@ class Instruction(LineOfAssembly):
 # -----------------------------------------------------------------------
 
 
+# Lowers the module one function at a time, yielding each function's instructions
+# as soon as they are produced. main is lowered first so it lands at the top of the
+# output without having to buffer and reorder the rest of the program. Small
+# functions are inlined into their callers unless inline_threshold is None.
 def python_rep_to_pdp_assembly(
     module: llvmlite.binding.module.ModuleRef,
-) -> list[LineOfAssembly]:
-    # First instruction branches to the main method
-    all_instructions = []
+    cost_model: CostModel = PDP_11_40,
+    inline_threshold: int = INLINE_THRESHOLD,
+    inline_budget: int = INLINE_BUDGET,
+) -> Iterator[InstructionStream]:
+    global branch_counter, label_counter
+    # labels are numbered per module so the output does not depend on earlier modules
+    branch_counter = 0
+    label_counter = 0
+
+    # each inlined function is parsed once and shared by all of its call sites
+    inlined_functions = {}
+    if inline_threshold is not None:
+        planned = plan_inlining(module, inline_threshold, inline_budget, Labels.MAIN.value)
+        inlined_functions = {
+            name: parse_function(str(function)) for name, function in planned.items()
+        }
+
+    # files with only helper functions have no main
+    try:
+        main_function = module.get_function(Labels.MAIN.value)
+    except NameError:
+        main_function = None
+
+    if main_function is not None:
+        yield translate_function(main_function, cost_model, inlined_functions)
 
     for function in module.functions:
-        pdp_instructions = translate_function(function)
-
-        # all_instructions.extend(pdp_instructions)
-
-        _, function_name = extract_function_info(str(function))
-
-        if function_name == Labels.MAIN.value:
-            # print("pdp: ", pdp_instructions)
-            # print("all: ", all_instructions)
-            pdp_instructions.extend(all_instructions)
-            all_instructions = pdp_instructions
-            # print("this:", all_instructions)
-        else:
-            all_instructions.extend(pdp_instructions)
-            # print("that: ", all_instructions)
-
-    return all_instructions
+        # every call to an inlined function has been replaced by its body
+        if function.name != Labels.MAIN.value and function.name not in inlined_functions:
+            yield translate_function(function, cost_model, inlined_functions)
 
 
 def translate_function(
     function: llvmlite.binding.value.ValueRef,
-) -> list[LineOfAssembly]:
-    env = Environment()
-
-    params, function_name = extract_function_info(str(function))
-    for param in params:
+    cost_model: CostModel = PDP_11_40,
+    inlined_functions: dict[str, IRFunction] = None,
+) -> InstructionStream:
+    env = Environment(cost_model, inlined_functions)
+    # each function interns its own labels so the table is freed with its stream
+    stream = InstructionStream(LabelTable())
+
+    # the function is printed once and everything below works on the parsed text
+    ir_function = parse_function(str(function))
+    function_name = ir_function.name
+    for param in ir_function.params:
         env.add(param, 2)
+    env.use_counts = count_uses(ir_function)
 
-    all_instructions = [function_name + ":"]
+    stream.append_label(stream.labels.intern(function_name))
 
     # setup sp (choose a good start location)
     if function_name == Labels.MAIN.value:
-        set_sp_instruction = Instruction(Opcode.MOV, TOP_OF_STACK, Registers.SP.value)
-        all_instructions.append(set_sp_instruction)
+        stream.append(Opcode.MOV, TOP_OF_STACK, SP)
 
-    for block in function.blocks:
-        pdp_instructions = translate_block(block, env)
-        all_instructions.extend(pdp_instructions)
+    for block in ir_function.blocks:
+        translate_block(block, env, stream)
 
     # halt at the end
     if function_name == Labels.MAIN.value:
         # pop RTS PC instruction if main
-        all_instructions.pop()
+        stream.pop()
+        stream.append(Opcode.HALT)
 
-        halt_instruction = Instruction(Opcode.HALT)
-        all_instructions.append(halt_instruction)
+    return stream
 
-    return all_instructions
 
-
-def translate_block(
-    block: llvmlite.binding.value.ValueRef, env: Environment
-) -> list[LineOfAssembly]:
+def translate_block(block: IRBlock, env: Environment, stream: InstructionStream):
     # Adding block label
-    block_label = get_block_label(block)
-    # print(block_label)
-    if ":" in block_label:
-        all_instructions = [env.get_label(block_label[:-1]) + ":"]
-        block_label = block_label.replace(":", "")
-    else:
-        all_instructions = []
-        block_label = 0
+    if block.label is not None:
+        stream.append_label(env.get_label(block.label))
 
-    for instr in block.instructions:
-        pdp_instructions = translate_instruction(instr, env)
-        all_instructions.extend(pdp_instructions)
+    skipped = plan_block(block.instructions, env)
 
-    return all_instructions
+    for index, instr in enumerate(block.instructions):
+        if index not in skipped:
+            translate_instruction(instr, env, stream)
 
 
-def translate_instruction(
-    instr: llvmlite.binding.value.ValueRef, env: Environment
-) -> list[LineOfAssembly]:
+def translate_instruction(instr: IRInstruction, env: Environment, stream: InstructionStream):
     match instr.opcode:
         case "alloca":
-            return translate_alloca(instr, env)
+            return translate_alloca(instr, env, stream)
 
-        case "add":
-            return translate_add(instr, env)
-        
-        case "sub":
-            raise NotImplementedError("Will implement sub")
-        
-        case "mul":
-            return translate_mul(instr, env)
-        
-        case "sdiv":
-            return translate_sdiv(instr, env)
-        
-        case "srem":
-            return translate_srem(instr, env)
+        case opcode if opcode in BINARY_OPERATIONS:
+            return translate_binary(instr, env, stream)
 
         case "store":
-            return translate_store(instr, env)
+            return translate_store(instr, env, stream)
 
         case "load":
-            return translate_load(instr, env)
+            return translate_load(instr, env, stream)
 
         case "ret":
-            return translate_ret(instr, env)
+            return translate_ret(instr, env, stream)
 
         case "call":
-            return translate_call(instr, env)
+            return translate_call(instr, env, stream)
 
         case "br":
-            return translate_branch(instr, env)
+            return translate_branch(instr, env, stream)
 
         case "icmp":
-            return translate_icmp(instr, env)
+            return translate_icmp(instr, env, stream)
 
         case _:
             raise NotImplementedError(f"Instruction {instr.opcode} not supported yet.")
 
 
-def translate_alloca(instr, env: Environment) -> list[LineOfAssembly]:
-    env.add(get_identifier_from_instruction(instr), 2)
-    return []
-
-
-def translate_add(instr, env: Environment) -> list[LineOfAssembly]:
-    instruction_identifier = get_identifier_from_instruction(instr)
-    env.add(instruction_identifier, 2)
-
-    operands = list(instr.operands)
-    operand_one = operands[0]
-    operand_two = operands[1]
-
-    operand_one_identifier = get_identifier_from_instruction(operand_one)
-    if operand_one.is_constant:
-        instruction_one = Instruction(
-            Opcode.ADD, operand_one_identifier, env.get(instruction_identifier)
-        )
-    else:
-        instruction_one = Instruction(
-            Opcode.ADD, env.get(operand_one_identifier), env.get(instruction_identifier)
-        )
-
-    operand_two_identifier = get_identifier_from_instruction(operand_two)
-    if operand_two.is_constant:
-        instruction_two = Instruction(
-            Opcode.ADD, operand_two_identifier, env.get(instruction_identifier)
-        )
-    else:
-        instruction_two = Instruction(
-            Opcode.ADD, env.get(operand_two_identifier), env.get(instruction_identifier)
-        )
-
-    clear_instruction = Instruction(Opcode.MOV, "#0", env.get(instruction_identifier))
-
-    return [clear_instruction, instruction_one, instruction_two]
-
-
-def translate_mul(instr, env: Environment) -> list[LineOfAssembly]:
-    instruction_identifier = get_identifier_from_instruction(instr)
-    env.add(instruction_identifier, 2)
-    
-    operands = list(instr.operands)
-    operand_one = operands[0]
-    operand_two = operands[1]
-
-    operand_one_identifier = get_identifier_from_instruction(operand_one)
-    operand_two_identifier = get_identifier_from_instruction(operand_two)
-
-    if operand_one.is_constant:
-        move_multiplicand_instruction = Instruction(Opcode.MOV, operand_one_identifier, Registers.R0.value)
-    else:
-        move_multiplicand_instruction = Instruction(Opcode.MOV, env.get(operand_one_identifier), Registers.R0.value)
-    
-    if operand_two.is_constant:
-        octal_value = get_octal_of_constant(operand_two_identifier)
-        move_constant_instruction = Instruction(Opcode.MOV, octal_value, Registers.R1.value)
-        multiply_instruction = Instruction(Opcode.MUL, Registers.R1.value, Registers.R0.value)
-        move_result_instruction = Instruction(Opcode.MOV, Registers.R1.value, env.get(instruction_identifier))
-        return [move_multiplicand_instruction, move_constant_instruction,
-                multiply_instruction, move_result_instruction]
-    else:
-        operand_two_identifier = get_identifier_from_instruction(operand_two)
-        multiply_instruction = Instruction(Opcode.MUL, env.get(operand_two_identifier), Registers.R0.value)
-        move_result_instruction = Instruction(Opcode.MOV, Registers.R1.value, env.get(instruction_identifier))
-        return [move_multiplicand_instruction, multiply_instruction, move_result_instruction]
-
-
-def translate_sdiv(instr, env: Environment) -> list[LineOfAssembly]:
-
-    instruction_identifier = get_identifier_from_instruction(instr)
-    env.add(instruction_identifier, 2)
-
-    operands = list(instr.operands)
-    operand_one = operands[0]
-    operand_two = operands[1]
-
-    operand_one_identifier = get_identifier_from_instruction(operand_one)
-    operand_two_identifier = get_identifier_from_instruction(operand_two)
-
-    move_zero_instruction = Instruction(Opcode.MOV, ZERO, Registers.R0.value)
-    if operand_one.is_constant:
-        move_dividend_instruction = Instruction(Opcode.MOV, get_octal_of_constant(operand_one_identifier), Registers.R1.value)
-    else:
-        move_dividend_instruction = Instruction(Opcode.MOV, env.get(operand_one_identifier), Registers.R1.value)
-    
-    if operand_two.is_constant:
-        divide_instruction = Instruction(Opcode.DIV, get_octal_of_constant(operand_two_identifier), Registers.R0.value)
-    else:
-        divide_instruction = Instruction(Opcode.DIV, env.get(operand_two_identifier), Registers.R0.value)
-
-    move_result_back_instruction = Instruction(Opcode.MOV, Registers.R0.value,
-                                               env.get(instruction_identifier))
+def translate_alloca(instr: IRInstruction, env: Environment, stream: InstructionStream):
+    env.add(instr.identifier, 2)
 
-    return [move_zero_instruction, move_dividend_instruction,
-            divide_instruction, move_result_back_instruction]
 
+# Lowers any operation in the pattern table
+def translate_binary(instr: IRInstruction, env: Environment, stream: InstructionStream):
+    instruction_identifier = instr.identifier
 
-def translate_srem(instr, env: Environment) -> list[LineOfAssembly]:
+    operand_one = get_operand(instr.operands[0], env)
+    operand_two = get_operand(instr.operands[1], env)
 
-    instruction_identifier = get_identifier_from_instruction(instr)
-    env.add(instruction_identifier, 2)
+    instructions = None
+    if instruction_identifier in env.result_slots:
+        store_slot = env.get(env.result_slots[instruction_identifier])
+        instructions = select(instr.opcode, operand_one, operand_two, store_slot, env.cost_model)
 
-    operands = list(instr.operands)
-    operand_one = operands[0]
-    operand_two = operands[1]
+    # no pattern can compute straight into the stored slot, go through a fresh one
+    if instructions is None:
+        env.add(instruction_identifier, 2)
+        destination = env.get(instruction_identifier)
+        instructions = select(instr.opcode, operand_one, operand_two, destination, env.cost_model)
+        if instruction_identifier in env.result_slots:
+            store_slot = env.get(env.result_slots[instruction_identifier])
+            instructions += select_move(destination, store_slot, env.cost_model)
 
-    operand_one_identifier = get_identifier_from_instruction(operand_one)
-    operand_two_identifier = get_identifier_from_instruction(operand_two)
-
-    move_zero_instruction = Instruction(Opcode.MOV, ZERO, Registers.R0.value)
-    if operand_one.is_constant:
-        move_dividend_instruction = Instruction(Opcode.MOV, get_octal_of_constant(operand_one_identifier), Registers.R1.value)
-    else:
-        move_dividend_instruction = Instruction(Opcode.MOV, env.get(operand_one_identifier), Registers.R1.value)
-    
-    if operand_two.is_constant:
-        divide_instruction = Instruction(Opcode.DIV, get_octal_of_constant(operand_two_identifier), Registers.R0.value)
-    else:
-        divide_instruction = Instruction(Opcode.DIV, env.get(operand_two_identifier), Registers.R0.value)
+    stream.extend(instructions)
 
-    move_result_back_instruction = Instruction(Opcode.MOV, Registers.R1.value,
-                                               env.get(instruction_identifier))
 
-    return [move_zero_instruction, move_dividend_instruction,
-            divide_instruction, move_result_back_instruction]
+def translate_store(instr: IRInstruction, env: Environment, stream: InstructionStream):
+    operand_one, operand_two = instr.operands
 
+    stream.extend(select_move(
+        get_operand(operand_one, env), get_operand(operand_two, env), env.cost_model
+    ))
 
-def translate_store(instr, env: Environment) -> list[LineOfAssembly]:
-    operands = list(instr.operands)
-    operand_one = operands[0]
-    operand_two = operands[1]
 
-    operand_one_identifier = get_identifier_from_instruction(operand_one)
-
-    operand_two_identifier = get_identifier_from_instruction(operand_two)
-
-    if operand_one.is_constant:
-        instruction = Instruction(
-            Opcode.MOV, get_octal_of_constant(operand_one_identifier),
-            env.get(operand_two_identifier)
-        )
-    else:
-        instruction = Instruction(
-            Opcode.MOV, env.get(operand_one_identifier), env.get(operand_two_identifier)
-        )
-
-    return [instruction]
+def translate_load(instr: IRInstruction, env: Environment, stream: InstructionStream):
+    identifier = instr.identifier
+    operand_identifier = instr.operands[0]
 
+    # the user reads the loaded slot itself
+    if identifier in env.folded_loads:
+        env.alias(identifier, operand_identifier)
+        return
 
-def translate_load(instr, env: Environment) -> list[LineOfAssembly]:
-    identifier = get_identifier_from_instruction(instr)
     env.add(identifier, 2)
+    stream.extend(select_move(env.get(operand_identifier), env.get(identifier), env.cost_model))
 
-    operands = list(instr.operands)
-    operand = operands[0]
-
-    operand_identifier = get_identifier_from_instruction(operand)
-
-    instruction = Instruction(
-        Opcode.MOV, env.get(operand_identifier), env.get(identifier)
-    )
-
-    return [instruction]
 
+def translate_ret(instr: IRInstruction, env: Environment, stream: InstructionStream):
+    operand = instr.operands[0]
 
-def translate_ret(instr, env: Environment) -> list[LineOfAssembly]:
-    operands = list(instr.operands)
-    operand = operands[0]
-
-    operand_identifier = get_identifier_from_instruction(operand)
-
-    if operand.is_constant:
-        mov_instruction = Instruction(Opcode.MOV, operand_identifier, Registers.R0.value)
-    else:
-        mov_instruction = Instruction(
-            Opcode.MOV, env.get(operand_identifier), Registers.R0.value
-        )
-
-    return_instruction = Instruction(Opcode.RTS, Registers.PC.value)
+    # inlined into a caller, hand the value over and continue after the body
+    if env.return_slot is not None:
+        stream.extend(select_move(get_operand(operand, env), env.return_slot, env.cost_model))
+        stream.append(Opcode.BR, label_operand(env.return_label))
+        env.return_branches += 1
+        return
 
-    return [mov_instruction, return_instruction]
+    stream.extend(select_move(get_operand(operand, env), R0, env.cost_model))
+    stream.append(Opcode.RTS, PC)
 
 
-def translate_call(instr, env: Environment) -> list[LineOfAssembly]:
-    instructions = []
+def translate_call(instr: IRInstruction, env: Environment, stream: InstructionStream):
+    function_name = instr.callee
+    if function_name in env.inlined_functions:
+        return translate_inlined_call(instr, env, stream, env.inlined_functions[function_name])
 
-    operands = list(instr.operands)
     # index of next parameter being pushed onto stack
     next_index = env.next_offset + 2
 
-    for i, op in enumerate(operands):
-        if i == len(operands) - 1:
-            break
-
-        operand_identifier = get_identifier_from_instruction(op)
-
-        store_param_onto_stack = Instruction(
-            Opcode.MOV, env.get(operand_identifier), f"{oct(next_index)[2:]}(SP)"
-        )
-        instructions.append(store_param_onto_stack)
+    for op in instr.operands:
+        stream.extend(select_move(
+            get_operand(op, env), indexed_operand(Registers.SP, next_index), env.cost_model
+        ))
         next_index += 2
 
-    add_SP_instruction = Instruction(
-        Opcode.ADD, f"#{oct(env.next_offset + 2)[2:]}", Registers.SP.value
-    )
-    instructions.append(add_SP_instruction)
+    stream.append(Opcode.ADD, immediate_operand(env.next_offset + 2), SP)
 
     # jump to the function
-    function_name = get_function_name_from_instruction(instr)
-    JSR_instruction = Instruction(Opcode.JSR, Registers.PC.value, function_name)
-    instructions.append(JSR_instruction)
+    stream.append(Opcode.JSR, PC, label_operand(stream.labels.intern(function_name)))
 
     # return SP to original position so offsets of new environment are accurate
-    return_SP_instruction = Instruction(
-        Opcode.SUB, f"#{oct(env.next_offset + 2)[2:]}", Registers.SP.value
-    )
-    instructions.append(return_SP_instruction)
+    stream.append(Opcode.SUB, immediate_operand(env.next_offset + 2), SP)
 
-    return_identifier = get_identifier_from_instruction(instr)
-    env.add(return_identifier, 2)
-    put_return_onto_stack = Instruction(
-        Opcode.MOV, Registers.R0.value, env.get(return_identifier)
-    )
-    instructions.append(put_return_onto_stack)
+    return_identifier = instr.identifier
+    if return_identifier in env.result_slots:
+        return_slot = env.get(env.result_slots[return_identifier])
+    else:
+        env.add(return_identifier, 2)
+        return_slot = env.get(return_identifier)
+    stream.append(Opcode.MOV, R0, return_slot)
+
+
+# Lowers the body of callee in place of the call. The callee gets its own environment
+# whose slots start after the caller's, its parameters refer to the argument slots
+# and every ret writes the result and branches past the body.
+def translate_inlined_call(
+    instr: IRInstruction,
+    env: Environment,
+    stream: InstructionStream,
+    callee: IRFunction,
+):
+    return_identifier = instr.identifier
+    if return_identifier in env.result_slots:
+        return_slot = env.get(env.result_slots[return_identifier])
+    else:
+        env.add(return_identifier, 2)
+        return_slot = env.get(return_identifier)
+
+    callee_env = Environment(env.cost_model, env.inlined_functions)
+    callee_env.next_offset = env.next_offset
+    callee_env.use_counts = count_uses(callee)
+    callee_env.return_slot = return_slot
+    callee_env.return_label = get_new_label(stream.labels)
+
+    # parameters are never written, so they can read the caller's slots directly
+    for param, op in zip(callee.params, instr.operands):
+        argument = get_operand(op, env)
+        if is_immediate(argument):
+            callee_env.add(param, 2)
+            stream.extend(select_move(argument, callee_env.get(param), env.cost_model))
+        else:
+            callee_env.bind(param, operand_value(argument))
+
+    for block in callee.blocks:
+        translate_block(block, callee_env, stream)
 
-    return instructions
+    # the last ret can fall through
+    if len(stream) and stream[-1] == Instruction(Opcode.BR, label_operand(callee_env.return_label)):
+        stream.pop()
+        callee_env.return_branches -= 1
 
+    if callee_env.return_branches:
+        stream.append_label(callee_env.return_label)
 
-def translate_branch(instr, env: Environment) -> list[LineOfAssembly]:
-    global label_counter
-    instr_split = str(instr).split(",")
+
+def translate_branch(instr: IRInstruction, env: Environment, stream: InstructionStream):
     # Unconditional branch
-    if len(instr_split) < 3:
-        (label, ) = get_fields_for_unconditional_branch(instr_split)
+    if not instr.operands:
+        (label, ) = instr.labels
         if not env.has_label(label):
-            branch_label = get_new_label()
+            branch_label = get_new_label(stream.labels)
         else:
             branch_label = env.get_label(label)
-        branch_instruction = Instruction(Opcode.BR, branch_label)
+        stream.append(Opcode.BR, label_operand(branch_label))
         env.add_label(label, branch_label)
-
-        return [branch_instruction]
     # Conditional branch
     else:
-        argument, if_true_label, if_false_label = get_fields_for_conditional_branch(
-            instr_split
-        )
+        (argument, ) = instr.operands
+        if_true_label, if_false_label = instr.labels
 
-        test_instruction = Instruction(Opcode.TST, env.get(argument))
         if not env.has_label(if_true_label):
-            true_branch_label = get_new_label()
+            true_branch_label = get_new_label(stream.labels)
             env.add_label(if_true_label, true_branch_label)
         else:
             true_branch_label = env.get_label(if_true_label)
         
         if not env.has_label(if_false_label):
-            false_branch_label = get_new_label()
+            false_branch_label = get_new_label(stream.labels)
             env.add_label(if_false_label, false_branch_label)
         else:
             false_branch_label = env.get_label(if_false_label)
-    
-        beq_instruction = Instruction(Opcode.BEQ, false_branch_label)
-        br_instruction = Instruction(Opcode.BR, true_branch_label)
 
-        return [test_instruction, beq_instruction, br_instruction]
+        # branch on the compare itself rather than on its stored result
+        if argument in env.fused_compares:
+            compare = env.fused_compares[argument]
+            stream.append(
+                Opcode.CMP,
+                get_operand(compare.operands[0], env),
+                get_operand(compare.operands[1], env),
+            )
+            branch_opcode = ICMP_TYPE_DICT[compare.predicate]
+            stream.append(branch_opcode, label_operand(true_branch_label))
+            stream.append(Opcode.BR, label_operand(false_branch_label))
+            return
+    
+        stream.append(Opcode.TST, env.get(argument))
+        stream.append(Opcode.BEQ, label_operand(false_branch_label))
+        stream.append(Opcode.BR, label_operand(true_branch_label))
 
 
-def translate_icmp(instr, env: Environment) -> list[LineOfAssembly]:
+def translate_icmp(instr: IRInstruction, env: Environment, stream: InstructionStream):
     global branch_counter
-    instructions = []
-    instr_identifier = get_identifier_from_instruction(instr)
+    instr_identifier = instr.identifier
 
-    operands = list(instr.operands)
-    operand_one = operands[0]
-    operand_two = operands[1]
-    if len(operands) < 2:
+    # evaluated by the branch that uses it
+    if instr_identifier in env.fused_compares:
+        return
+
+    if len(instr.operands) < 2:
         raise ValueError("Not comparing two operands")
-    operand1_identifier = get_identifier_from_instruction(operands[0])
-    operand2_identifier = get_identifier_from_instruction(operands[1])
+    operand_one, operand_two = instr.operands
 
-    if not operand_one.is_constant:
-        operand1_identifier = env.get(operand1_identifier)
+    icmp_type = instr.predicate
+    env.add(instr_identifier, 2)
 
-    if not operand_two.is_constant:
-        operand2_identifier = env.get(operand2_identifier)
+    icmp_label = stream.labels.intern(get_ICMP_label())
+    done_with_icmp_label = stream.labels.intern(get_DONE_WITH_ICMP_label())
 
-    icmp_type = get_icmp_type_from_instruction(instr)
-    env.add(instr_identifier, 2)
-    compare_instruction = Instruction(
-        Opcode.CMP, operand1_identifier, operand2_identifier
-    )
-    branch_icmp_instruction = Instruction(
-        ICMP_TYPE_DICT[icmp_type], get_ICMP_label()
-    )
-    if_no_branch_set_to_zero = Instruction(
-        Opcode.MOV, "#0", env.get(instr_identifier)
-    )
-    go_to_done_with_branch = Instruction(
-        Opcode.BR, get_DONE_WITH_ICMP_label()
-    )
-    instructions = [
-        compare_instruction,
-        branch_icmp_instruction,
-        if_no_branch_set_to_zero,
-        go_to_done_with_branch,
-    ]
-
-    instructions.append(f"{get_ICMP_label()}:")
-    if_branch_set_to_one = Instruction(
-        Opcode.MOV, "#1", env.get(instr_identifier)
-    )
-    instructions.append(if_branch_set_to_one)
-
-    instructions.append(f"{get_DONE_WITH_ICMP_label()}:")
+    stream.append(Opcode.CMP, get_operand(operand_one, env), get_operand(operand_two, env))
+    stream.append(ICMP_TYPE_DICT[icmp_type], label_operand(icmp_label))
+    stream.extend(select_move(ZERO, env.get(instr_identifier), env.cost_model))
+    stream.append(Opcode.BR, label_operand(done_with_icmp_label))
+
+    stream.append_label(icmp_label)
+    stream.append(Opcode.MOV, ONE, env.get(instr_identifier))
+
+    stream.append_label(done_with_icmp_label)
 
     branch_counter += 1
 
-    return instructions
+
+# -----------------------------------------------------------------------
+# Use-def analysis for instruction selection
+# -----------------------------------------------------------------------
+
+
+def count_uses(function: IRFunction) -> dict[str, int]:
+    use_counts = {}
+    for block in function.blocks:
+        for instr in block.instructions:
+            for operand in instr.operands:
+                if is_local_value(operand):
+                    use_counts[operand] = use_counts.get(operand, 0) + 1
+    return use_counts
+
+
+# Decides which values of the block are folded into their single user and returns
+# the indices of stores that no longer need to be emitted
+def plan_block(instructions: list[IRInstruction], env: Environment) -> set[int]:
+    users = {}
+    for index, instr in enumerate(instructions):
+        for operand in instr.operands:
+            users[operand] = index
+
+    skipped = set()
+    for index, instr in enumerate(instructions):
+        identifier = instr.identifier
+        if env.use_counts.get(identifier) != 1:
+            continue
+        user = users.get(identifier)
+        if user is None or user <= index:
+            continue
+
+        match instr.opcode:
+            # a load can be read in place if nothing writes its slot before the use
+            case "load":
+                slot = instr.operands[0]
+                if not any(
+                    instructions[between].opcode == "call"
+                    or (instructions[between].opcode == "store"
+                        and instructions[between].operands[-1] == slot)
+                    for between in range(index + 1, user)
+                ):
+                    env.folded_loads.add(identifier)
+
+            case "icmp":
+                if user == index + 1 and instructions[user].opcode == "br":
+                    env.fused_compares[identifier] = instr
+
+            case opcode if opcode in BINARY_OPERATIONS or opcode == "call":
+                if (user == index + 1 and instructions[user].opcode == "store"
+                        and instructions[user].operands[0] == identifier):
+                    env.result_slots[identifier] = instructions[user].operands[-1]
+                    skipped.add(user)
+
+    return skipped
 
 
 # -----------------------------------------------------------------------
@@ -614,20 +569,88 @@ def print_module(module: llvmlite.binding.module.ModuleRef):
                     print("    Operand:", op)
 
 
-def get_identifier_from_instruction(instr) -> str:
-    str_instr = str(instr).lstrip()
+# Splits the text of a function into its blocks and parsed instructions
+def parse_function(function_string: str) -> IRFunction:
+    params, function_name = extract_function_info(function_string)
 
-    if instr.is_constant:
-        identifier = str_instr[str_instr.index(" ") :].lstrip()
-
-        return f"#{identifier}"
-    else:
-        if "=" in str_instr:
-            identifier = str_instr[: str_instr.index(" ")]
+    blocks = []
+    in_body = False
+    for line in function_string.split("\n"):
+        if line.startswith("define"):
+            in_body = True
+        elif not in_body or not line.strip() or line.startswith(";"):
+            continue
+        elif line.startswith("}"):
+            break
+        elif not line[0].isspace():
+            blocks.append(IRBlock(line[: line.find(":")], []))
         else:
-            identifier = str_instr[str_instr.index(" ") :].lstrip()
+            if not blocks:
+                blocks.append(IRBlock(None, []))
+            blocks[-1].instructions.append(parse_instruction(line))
+
+    return IRFunction(function_name, params, blocks)
 
-        return identifier
+
+def parse_instruction(line: str) -> IRInstruction:
+    str_instr = line.strip()
+
+    identifier = None
+    if str_instr.startswith("%"):
+        identifier, str_instr = str_instr.split(" = ", 1)
+
+    opcode = str_instr.split(" ", 1)[0]
+    # the value of each typed operand is its last word
+    fields = [field.split()[-1] for field in str_instr.split(",")]
+
+    match opcode:
+        case "alloca":
+            return IRInstruction(opcode, identifier, [])
+
+        case "store":
+            return IRInstruction(opcode, identifier, fields[:2])
+
+        case "load":
+            return IRInstruction(opcode, identifier, [fields[1]])
+
+        case "ret":
+            return IRInstruction(opcode, identifier, fields[:1])
+
+        case "icmp":
+            return IRInstruction(
+                opcode, identifier, fields[:2], predicate=get_icmp_type_from_instruction(str_instr)
+            )
+
+        case "call":
+            start_parenthesis_index = str_instr.find("(")
+            end_parenthesis_index = str_instr.find(")", start_parenthesis_index)
+            args = str_instr[start_parenthesis_index + 1 : end_parenthesis_index].split(",")
+            return IRInstruction(
+                opcode,
+                identifier,
+                [arg.split()[-1] for arg in args if arg.strip()],
+                callee=get_function_name_from_instruction(str_instr),
+            )
+
+        case "br":
+            instr_split = str_instr.split(",")
+            # Unconditional branch
+            if len(instr_split) < 3:
+                return IRInstruction(
+                    opcode, identifier, [], get_fields_for_unconditional_branch(instr_split)
+                )
+            argument, if_true_label, if_false_label = get_fields_for_conditional_branch(
+                instr_split
+            )
+            return IRInstruction(opcode, identifier, [argument], (if_true_label, if_false_label))
+
+        # two operand arithmetic
+        case _:
+            return IRInstruction(opcode, identifier, fields[:2])
+
+
+def is_local_value(operand: str) -> bool:
+    return operand.startswith("%")
 
 
 def get_identifier_from_operand_with_type(operand) -> str:
@@ -637,8 +660,12 @@ def get_identifier_from_operand_with_type(operand) -> str:
     return identifier.lstrip()
 
 
-def get_octal_of_constant(identifier) -> str:
-    return f"#{oct(int(identifier[1:]))[2:]}"
+# Encoded operand for an IR value, either an immediate or its slot on the stack
+def get_operand(operand: str, env: Environment) -> int:
+    if is_local_value(operand):
+        return env.get(operand)
+    return immediate_operand(int(operand))
+
 
 def get_function_name_from_instruction(instr) -> str:
     str_instr = str(instr)
@@ -657,12 +684,6 @@ def get_icmp_type_from_instruction(instr) -> str:
     return str_instr[icmp_index + 1]
 
 
-def get_block_label(block) -> str:
-    label = str(block).lstrip().split("\n")[0]
-    colon_index = label.find(":")
-    return label[: colon_index + 1]
-
-
 def get_fields_for_conditional_branch(instr_split: list[str]):
     argument = instr_split[0].lstrip().split(" ")[2]
     if_true_label = instr_split[1].lstrip().split(" ")[1].replace("%", "")
@@ -683,8 +704,8 @@ def get_DONE_WITH_ICMP_label():
     return f"{Labels.DONE_WITH_ICMP.value}{branch_counter}"
 
 
-def get_new_label():
+def get_new_label(labels: LabelTable) -> int:
     global label_counter 
-    result = f"{Labels.LABEL_LABEL.value}{label_counter}"
+    result = labels.intern(f"{Labels.LABEL_LABEL.value}{label_counter}")
     label_counter += 1
     return result
\ No newline at end of file
@@ -0,0 +1,115 @@
+import pytest
+
+pytest.importorskip("llvmlite")
+
+from compiler.compile_to_pdp import emit_pdp_assembly, llvm_ir_to_python_rep
+from compiler.cost_model import PDP_11_40, instruction_size
+from compiler.instructions import (
+    Instruction,
+    Opcode,
+    Registers,
+    immediate_operand,
+    indexed_operand,
+    label_operand,
+    register_operand,
+)
+
+# Sums 0..9 in a loop and then calls g, which is placed after main in the output
+LOOP_IR = """define dso_local i32 @main() #0 {
+  %1 = alloca i32, align 4
+  %2 = alloca i32, align 4
+  store i32 0, i32* %1, align 4
+  store i32 0, i32* %2, align 4
+  br label %3
+
+3:
+  %4 = load i32, i32* %2, align 4
+  %5 = icmp slt i32 %4, 10
+  br i1 %5, label %6, label %11
+
+6:
+  %7 = load i32, i32* %1, align 4
+  %8 = add nsw i32 %7, %4
+  store i32 %8, i32* %1, align 4
+  %9 = load i32, i32* %2, align 4
+  %10 = add nsw i32 %9, 1
+  store i32 %10, i32* %2, align 4
+  br label %3
+
+11:
+  %12 = call i32 @g(i32 noundef 7)
+  ret i32 %12
+}
+
+define dso_local i32 @g(i32 noundef %0) #0 {
+  ret i32 %0
+}
+"""
+
+
+@pytest.fixture
+def compiled(tmp_path):
+    ir_path = tmp_path / "loop.ll"
+    ir_path.write_text(LOOP_IR)
+    pdp_path = tmp_path / "loop.s"
+    estimates = emit_pdp_assembly(
+        llvm_ir_to_python_rep(str(ir_path)), str(pdp_path), PDP_11_40,
+        listing=True, inline_threshold=None,
+    )
+    return estimates, pdp_path.read_text().splitlines()
+
+
+def test_instruction_size():
+    slot = indexed_operand(Registers.SP, 4)
+    r0 = register_operand(Registers.R0)
+    assert instruction_size(Instruction(Opcode.LABEL, label_operand(0))) == 0
+    assert instruction_size(Instruction(Opcode.MOV, r0, r0)) == 1
+    assert instruction_size(Instruction(Opcode.CLR, slot)) == 2
+    assert instruction_size(Instruction(Opcode.MOV, immediate_operand(5), slot)) == 3
+    assert instruction_size(Instruction(Opcode.BR, label_operand(0))) == 1
+    assert instruction_size(
+        Instruction(Opcode.JSR, register_operand(Registers.PC), label_operand(0))
+    ) == 2
+
+
+def test_function_estimates(compiled):
+    estimates, _ = compiled
+    main, g = estimates
+
+    assert (main.name, main.size, main.calls) == ("main", 35, 1)
+    assert (g.name, g.size, g.calls) == ("g", 3, 0)
+    assert main.cycles == sum(block.cycles for block in main.blocks)
+
+
+# blocks start at labels and after branches, unlabelled ones are named from the label
+def test_blocks(compiled):
+    main, _ = compiled[0]
+    assert [(block.name, block.size) for block in main.blocks] == [
+        ("main", 7), ("L0", 7), ("L0+4", 1), ("L1", 6), ("L2", 14),
+    ]
+
+
+# only the branch back to L0 closes a loop, running from L0 to that branch
+def test_single_loop(compiled):
+    main, g = compiled[0]
+    assert [loop.name for loop in main.loops] == ["L0"]
+    assert main.loops[0].size == 14
+    assert main.loops[0].cycles == sum(
+        block.cycles for block in main.blocks if block.name.startswith(("L0", "L1"))
+    )
+    assert g.loops == []
+
+
+def test_listing(compiled):
+    _, lines = compiled
+
+    # every comment starts in the same column
+    assert {line.index(";") for line in lines} == {32}
+    assert lines[0] == f"{'main:':<31} ; {'0':>6}"
+    assert lines[1].split(";")[1] == f" {'0':>6} {2:>2}w {13:>4}c"
+
+    # addresses are in octal bytes and keep running into the next function
+    addresses = [line.split(";")[1].split()[0] for line in lines]
+    assert addresses[:6] == ["0", "0", "4", "10", "14", "16"]
+    assert lines[addresses.index("106")].startswith("g:")
+    assert 2 * sum(estimate.size for estimate in compiled[0]) == 0o114
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("llvmlite")
+
+from compiler.compile_to_pdp import llvm_ir_to_python_rep
+from compiler.inlining import function_size, plan_inlining, recursive_functions
+
+
+# One argument function that calls each callee in turn and then adds until it is size
+# instructions long. %1 is the entry block, so the first value is %2.
+def function_ir(name: str, size: int, callees: list[str] = ()) -> str:
+    lines = [f"define dso_local i32 @{name}(i32 noundef %0) #0 {{"]
+    values = [0] + list(range(2, size + 1))
+    for index, callee in enumerate(callees):
+        lines.append(f"  %{values[index + 1]} = call i32 @{callee}(i32 noundef %{values[index]})")
+    for index in range(len(callees), size - 1):
+        lines.append(f"  %{values[index + 1]} = add nsw i32 %{values[index]}, 1")
+    lines.append(f"  ret i32 %{values[size - 1]}")
+    return "\n".join(lines) + "\n}\n\n"
+
+
+def load_module(tmp_path, ir: str):
+    ir_path = tmp_path / "test.ll"
+    ir_path.write_text(ir)
+    return llvm_ir_to_python_rep(str(ir_path))
+
+
+# main calls a three times and a calls b, each 33 instructions long
+@pytest.fixture
+def nested(tmp_path):
+    main = """define dso_local i32 @main() #0 {
+  %1 = call i32 @a(i32 noundef 1)
+  %2 = call i32 @a(i32 noundef %1)
+  %3 = call i32 @a(i32 noundef %2)
+  ret i32 %3
+}
+"""
+    return load_module(tmp_path, function_ir("b", 33) + function_ir("a", 33, ["b"]) + main)
+
+
+def test_function_sizes(nested):
+    assert function_size(nested.get_function("a")) == 33
+    assert function_size(nested.get_function("b")) == 33
+
+
+# with b inlined, a is 66 instructions and over the threshold
+def test_nested_callee_counts_towards_caller_size(nested):
+    assert set(plan_inlining(nested, threshold=40, budget=70)) == {"b"}
+
+
+# three copies of a with b inside replace one copy of each
+def test_nested_growth_counts_every_emitted_copy(nested):
+    assert set(plan_inlining(nested, threshold=70, budget=131)) == {"b"}
+    assert set(plan_inlining(nested, threshold=70, budget=132)) == {"a", "b"}
+
+
+def test_recursive_function_is_not_inlined(tmp_path):
+    module = load_module(tmp_path, function_ir("r", 4, ["r"]) + function_ir("main", 3, ["r"]))
+    assert plan_inlining(module) == {}
+
+
+def test_recursive_functions():
+    call_graph = {
+        "main": ["a", "d"],
+        "a": ["b"],
+        "b": ["c", "a"],
+        "c": [],
+        "d": ["d", "c", "printf"],
+    }
+    assert recursive_functions(call_graph) == {"a", "b", "d"}
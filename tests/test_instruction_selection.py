@@ -0,0 +1,142 @@
+import pytest
+
+pytest.importorskip("llvmlite")
+
+from compiler.compile_to_pdp import llvm_ir_to_python_rep
+from compiler.cost_model import PDP_11_40
+from compiler.instruction_selection import select
+from compiler.instructions import (
+    Instruction,
+    Opcode,
+    Registers,
+    immediate_operand,
+    indexed_operand,
+)
+from compiler.python_rep_to_pdp_assembly import python_rep_to_pdp_assembly
+
+# Lowers hand-written IR with inlining off and checks the selected instructions. The
+# IR uses typed pointers as printed by clang -O0. In every function below the
+# parameters sit at 2(SP) and 4(SP) and the allocas %3 and %4 at 6(SP) and 10(SP).
+
+PROLOGUE = """define dso_local i32 @f(i32 noundef %0, i32 noundef %1) #0 {
+  %3 = alloca i32, align 4
+  %4 = alloca i32, align 4
+  store i32 %0, i32* %3, align 4
+  store i32 %1, i32* %4, align 4
+"""
+
+
+def lower(tmp_path, body: str, functions: str = "") -> list[str]:
+    ir_path = tmp_path / "test.ll"
+    ir_path.write_text(functions + PROLOGUE + body + "}\n")
+    module = llvm_ir_to_python_rep(str(ir_path))
+
+    for stream in python_rep_to_pdp_assembly(module, inline_threshold=None):
+        lines = list(stream.format_lines())
+        if lines[0] == "f:":
+            return [line.strip() for line in lines[3:]]
+
+
+# x = x - y where the loaded x is read in place and the result goes back to y's slot
+def test_sub_into_second_operand(tmp_path):
+    lines = lower(tmp_path, """  %5 = load i32, i32* %3, align 4
+  %6 = load i32, i32* %4, align 4
+  %7 = sub nsw i32 %5, %6
+  store i32 %7, i32* %4, align 4
+  %8 = load i32, i32* %4, align 4
+  ret i32 %8
+""")
+    # 10(SP) = 6(SP) - 10(SP) without a temporary
+    assert lines[:2] == ["NEG 10(SP)", "ADD 6(SP), 10(SP)"]
+
+
+def test_sub_from_zero(tmp_path):
+    lines = lower(tmp_path, """  %5 = load i32, i32* %3, align 4
+  %6 = sub nsw i32 0, %5
+  store i32 %6, i32* %4, align 4
+  %7 = load i32, i32* %4, align 4
+  ret i32 %7
+""")
+    assert lines[:2] == ["MOV 6(SP), 10(SP)", "NEG 10(SP)"]
+
+
+def test_add_one(tmp_path):
+    lines = lower(tmp_path, """  %5 = load i32, i32* %3, align 4
+  %6 = add nsw i32 %5, 1
+  store i32 %6, i32* %3, align 4
+  %7 = load i32, i32* %3, align 4
+  ret i32 %7
+""")
+    assert lines[:1] == ["INC 6(SP)"]
+
+
+def test_load_blocked_by_store(tmp_path):
+    lines = lower(tmp_path, """  %5 = load i32, i32* %3, align 4
+  store i32 7, i32* %3, align 4
+  %6 = load i32, i32* %4, align 4
+  %7 = add nsw i32 %5, %6
+  ret i32 %7
+""")
+    # the old value of 6(SP) is copied out before it is overwritten
+    assert lines[:4] == [
+        "MOV 6(SP), 12(SP)",
+        "MOV #7, 6(SP)",
+        "MOV 12(SP), 14(SP)",
+        "ADD 10(SP), 14(SP)",
+    ]
+
+
+def test_load_blocked_by_call(tmp_path):
+    lines = lower(tmp_path, """  %5 = load i32, i32* %3, align 4
+  %6 = call i32 @g()
+  %7 = add nsw i32 %5, %6
+  ret i32 %7
+""", functions="""define dso_local i32 @g() #0 {
+  ret i32 5
+}
+
+""")
+    assert lines[0] == "MOV 6(SP), 12(SP)"
+    assert lines[lines.index("JSR PC, g") + 3] == "MOV 12(SP), 16(SP)"
+
+
+def test_load_folded_into_user(tmp_path):
+    lines = lower(tmp_path, """  %5 = load i32, i32* %3, align 4
+  %6 = load i32, i32* %4, align 4
+  %7 = add nsw i32 %5, %6
+  ret i32 %7
+""")
+    assert lines[:2] == ["MOV 6(SP), 12(SP)", "ADD 10(SP), 12(SP)"]
+
+
+def test_icmp_fused_into_branch(tmp_path):
+    lines = lower(tmp_path, """  %5 = load i32, i32* %3, align 4
+  %6 = load i32, i32* %4, align 4
+  %7 = icmp slt i32 %5, %6
+  br i1 %7, label %8, label %9
+
+8:
+  ret i32 %5
+
+9:
+  ret i32 %6
+""")
+    assert lines[:3] == ["MOV 6(SP), 12(SP)", "MOV 10(SP), 14(SP)", "CMP 12(SP), 14(SP)"]
+    opcode, true_label = lines[3].split()
+    assert opcode == "BLT"
+    opcode, false_label = lines[4].split()
+    assert opcode == "BR"
+    assert true_label != false_label
+    assert f"{true_label}:" in lines and f"{false_label}:" in lines
+    assert "TST" not in " ".join(lines)
+
+
+
+# both orders take 8510ns on the 11/40, so the operands are not swapped
+def test_equal_time_keeps_operand_order():
+    a = indexed_operand(Registers.SP, 2)
+    dst = indexed_operand(Registers.SP, 4)
+    assert select("add", a, immediate_operand(5), dst, PDP_11_40) == [
+        Instruction(Opcode.MOV, a, dst),
+        Instruction(Opcode.ADD, immediate_operand(5), dst),
+    ]